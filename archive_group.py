@@ -30,15 +30,61 @@ writeLogFile = True
 # Set this to False if you do not want to archive attachments
 saveAttachments = True
 
+# Set this to True to store messages zstd-compressed as "N.json.zst"
+# (requires the zstandard package; message JSON compresses ~5-10x)
+compressMessages = False
+
+# Set this to True to land each message via a ".tmp" file plus atomic
+# rename.  The default writes directly, halving the directory-modifying
+# syscalls per message; a crash mid-write can then leave one partial
+# file, which the next run re-downloads since its id never reached the
+# manifest.
+durableWrites = False
+
+# Number of messages to download at the same time
+threadCount = 8
+
+# Seconds to wait on an unresponsive connection before retrying it
+requestTimeout = 30
+
+# Bounds, in seconds, for the shared delay between requests to Yahoo
+minWaitTime = 0.0
+maxWaitTime = 10.0
+
 import json  # required for reading various JSON attributes from the content
 import requests  # required for fetching the raw messages
 import os  # required for checking if a file exists locally
 import time  # required if Yahoo blocks access temporarily (to wait)
 import sys  # required to cancel script if blocked by Yahoo
 import shutil  # required for deletung an old folder
-import glob  # required to find the most recent message downloaded
 import time  # required to log the date and time of run
 import re  # required to parse messages to identify/download attachments
+import random  # required to jitter the retry backoff
+import collections  # required for the bounded queue of in-flight downloads
+import concurrent.futures  # required to download several messages at once
+import logging  # required to log to the console and the group log file
+import email.utils  # required to parse HTTP-date Retry-After headers
+
+try:
+    import orjson  # parses JSON several times faster than the stdlib
+except ImportError:
+    orjson = json  # fall back to the stdlib parser, same interface here
+
+try:
+    import numpy  # vectorizes the filename-to-id scan when available
+except ImportError:
+    numpy = None
+
+try:
+    import zstandard as zstd  # only needed when compressMessages is True
+except ImportError:
+    zstd = None
+import itertools  # required to chain the gap ranges into one iterator
+import queue  # required to hand finished downloads to the writer thread
+import threading  # required to run the background writer thread
+import hashlib  # required to fingerprint attachments for deduplication
+import sqlite3  # required for the on-disk attachment hash index
+import stat  # required to test file type from a single stat call
 
 
 def json_path(groupName, msgNumber):
@@ -51,54 +97,393 @@ def attachment_path(groupName, msgNumber, attachment):
     return os.path.join(groupName, "{}-{}".format(msgNumber, attachment))
 
 
+# One shared HTTP session so the TCP and TLS handshakes to Yahoo are paid
+# once and the connections are reused by every request.  The pool is sized
+# to the download thread count so workers never fight over sockets, and
+# pool_block keeps a burst of workers from opening extra connections.
+session = requests.Session()
+session.cookies.update({"T": cookie_T, "Y": cookie_Y})
+session.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=threadCount,
+        pool_block=True,
+        max_retries=requests.adapters.Retry(total=0, connect=3, backoff_factor=0.1),
+    ),
+)
+
+
+# Detects Yahoo's login page in a failed API response.  Compiled once at
+# module scope, as a bytes pattern so resp.content can be scanned without
+# decoding, and with a bounded gap instead of '.*?' so a hostile page
+# cannot trigger pathological backtracking.
+_LOGIN_RE = re.compile(rb"yahoo[^<>]{0,64}login", re.IGNORECASE)
+
+# Attachment-scraping patterns, compiled once instead of per message.
+# Negated character classes instead of lazy '.+?' - they match in one
+# forward pass with no backtracking on pathological pages.  These stay
+# str patterns: they scan the "html" field of an already-parsed JSON
+# document, so there are no bytes to match against without a re-encode.
+_ANCHOR_RE = re.compile(r"<a\s([^>]*)>")
+_HREF_RE = re.compile(r'href="(https://xa.yimg.com/kq/groups/[^"?]+\?download=1)"')
+_FILENAME_RE = re.compile(r'label="Download (?:photo|attachment) ([^"]+)"')
+
+
+class RateGovernor:
+    """ Shared pacer so the download workers back off from Yahoo together
+
+    Every worker asks for the next request slot before it talks to Yahoo.
+    A failure doubles the interval between slots and a success shrinks it
+    gently (additive-increase, multiplicative-decrease), so one throttled
+    worker slows the whole pool rather than just itself.
+    """
+
+    def __init__(self, minWait=minWaitTime, maxWait=maxWaitTime):
+        self.minWait = minWait
+        self.maxWait = maxWait
+        self.interval = minWait
+        self._lock = threading.Lock()
+        self._nextSlot = 0.0
+
+    def wait(self):
+        """ Block until this worker's request slot arrives """
+        with self._lock:
+            now = time.monotonic()
+            slot = self._nextSlot if self._nextSlot > now else now
+            self._nextSlot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.interval = max(self.minWait, self.interval * 0.9)
+
+    def on_error(self):
+        with self._lock:
+            self.interval = min(self.maxWait, max(self.interval * 2, 0.5))
+
+    def hold_off(self, seconds):
+        """ Push every worker's next slot out, e.g. for a Retry-After hint """
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._nextSlot:
+                self._nextSlot = until
+
+
+governor = RateGovernor()
+
+
+def _retry_after_seconds(value):
+    """ Parse a Retry-After header into seconds, or None if unusable """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:  # the header may also be an HTTP date
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, min(seconds, 300.0))  # ignore a hostile/absurd value
+
+# Set when Yahoo answers with an unrecoverable error (e.g. we got blocked).
+# sys.exit only unwinds the calling thread, so the download workers check
+# this event instead and stop picking up new messages together.
+_stopEvent = threading.Event()
+
+
+# Finished downloads are written to disk by a single background thread so
+# the download workers never block on filesystem latency.  The queue is
+# bounded so a slow disk applies backpressure instead of growing the heap.
+_writeQueue = queue.Queue(maxsize=64)
+_writerThread = None
+_writerLock = threading.Lock()
+# Message ids whose disk write failed; they must stay out of the manifest
+# so a retry run re-fetches them.
+_failedWrites = set()
+
+
+def _writer_loop():
+    while True:
+        tmpPath, jsonPath, data, msgNumber = _writeQueue.get()
+        try:
+            if durableWrites:
+                with open(tmpPath, "wb") as writeFile:
+                    writeFile.write(data)
+                os.replace(tmpPath, jsonPath)
+            else:
+                with open(jsonPath, "wb") as writeFile:
+                    writeFile.write(data)
+        except Exception as writeError:
+            # the writer must outlive a failed write (disk full, bad
+            # permissions): if this thread dies, the bounded queue blocks
+            # every download worker and the final join() hangs the run
+            logger.info("Failed to write %s (%s)", jsonPath, writeError)
+            with _writerLock:
+                _failedWrites.add(msgNumber)
+        finally:
+            _writeQueue.task_done()
+
+
+_threadLocal = threading.local()
+
+# Content-hash index used to hard-link identical attachments instead of
+# storing the same bytes repeatedly (reposts are common on big groups).
+_hashIndexLock = threading.Lock()
+_hashIndexConn = None
+
+
+def _hash_index(groupName):
+    global _hashIndexConn
+    if _hashIndexConn is None:
+        _hashIndexConn = sqlite3.connect(
+            os.path.join(groupName, ".hashes.sqlite"), check_same_thread=False
+        )
+        _hashIndexConn.execute(
+            "CREATE TABLE IF NOT EXISTS content (hash BLOB PRIMARY KEY, path TEXT)"
+        )
+    return _hashIndexConn
+
+
+def save_attachment(groupName, savePath, resp):
+    """ Stream an attachment to disk, hard-linking known duplicate content
+
+    The body is written (and hashed) in 128 KiB chunks as it arrives, so
+    even a huge attachment never has to sit fully in memory.
+    """
+    sha = hashlib.sha256()
+    tmpPath = savePath + ".tmp"
+    with open(tmpPath, "wb") as f:
+        for chunk in resp.iter_content(chunk_size=131072):
+            sha.update(chunk)
+            f.write(chunk)
+    digest = sha.digest()
+    with _hashIndexLock:
+        conn = _hash_index(groupName)
+        row = conn.execute(
+            "SELECT path FROM content WHERE hash = ?", (digest,)
+        ).fetchone()
+    if row is not None:
+        # no isfile() pre-check: os.link itself fails cleanly if the
+        # original was deleted, so the extra stat per duplicate is wasted
+        try:
+            os.link(row[0], savePath)
+            os.remove(tmpPath)
+            print("Linked duplicate attachment: {}".format(savePath))
+            return
+        except OSError:
+            pass  # source gone, cross-filesystem or unsupported; keep the copy
+    os.replace(tmpPath, savePath)
+    with _hashIndexLock:
+        conn.execute(
+            "INSERT OR REPLACE INTO content VALUES (?, ?)", (digest, savePath)
+        )
+        conn.commit()
+    print("Saved attachment: {}".format(savePath))
+
+
+def _compressor():
+    """ Per-thread ZstdCompressor; the object is stateful but cheap to reuse """
+    cctx = getattr(_threadLocal, "cctx", None)
+    if cctx is None:
+        cctx = _threadLocal.cctx = zstd.ZstdCompressor(level=3)
+    return cctx
+
+
+def queue_write(jsonPath, data, msgNumber):
+    """ Hand a finished download to the background writer thread """
+    global _writerThread
+    # two workers racing the None check would spawn two writer threads
+    with _writerLock:
+        if _writerThread is None:
+            _writerThread = threading.Thread(target=_writer_loop, daemon=True)
+            _writerThread.start()
+    _writeQueue.put((jsonPath + ".tmp", jsonPath, data, msgNumber))
+
+
+def archived_message_ids(groupName):
+    """ Return the set of message numbers already saved in the group folder """
+    # os.scandir keeps the whole scan in one pass over the directory and
+    # avoids the stat-per-entry cost that glob/os.walk would pay; a missing
+    # folder surfaces as FileNotFoundError rather than a separate exists().
+    try:
+        entries = os.scandir(groupName)
+    except FileNotFoundError:
+        return set()
+    with entries:
+        jsonNames = (
+            entry.name
+            for entry in entries
+            if entry.name.endswith((".json", ".json.zst"))
+            and entry.is_file(follow_symlinks=False)
+            and entry.stat().st_size > 0
+        )
+        # attachments share this folder as "N-name" and can themselves end
+        # in .json; only purely numeric stems are message files
+        msgStems = (
+            stem
+            for stem in (name.partition(".")[0] for name in jsonNames)
+            if stem.isdigit()
+        )
+        if numpy is not None:
+            # convert every stem to an integer in one C-level pass instead
+            # of one int() call per file
+            return set(
+                numpy.fromiter(msgStems, dtype="S24").astype(numpy.int64).tolist()
+            )
+        return {int(stem) for stem in msgStems}
+
+
+def open_manifest(groupName):
+    """ Open the group's manifest DB of archived message ids
+
+    The manifest lets repeat runs query the archived set instead of
+    walking the whole group folder; the first run (or an empty manifest)
+    seeds it from a directory scan.
+    """
+    conn = sqlite3.connect(os.path.join(groupName, ".manifest.sqlite"))
+    conn.execute("CREATE TABLE IF NOT EXISTS archived (id INTEGER PRIMARY KEY)")
+    if conn.execute("SELECT 1 FROM archived LIMIT 1").fetchone() is None:
+        ids = archived_message_ids(groupName)
+        if ids:
+            conn.executemany(
+                "INSERT OR IGNORE INTO archived VALUES (?)", ((i,) for i in ids)
+            )
+            conn.commit()
+    return conn
+
+
+def _seen(bits, msgNumber):
+    """ Check whether a message number is marked in the archived bitset """
+    return bits[msgNumber >> 3] & (1 << (msgNumber & 7))
+
+
+def _mark(bits, msgNumber):
+    """ Mark a message number in the archived bitset """
+    bits[msgNumber >> 3] |= 1 << (msgNumber & 7)
+
+
+def missing_runs(bits, first, last):
+    """ Yield (start, end) ranges of message numbers not marked in the bitset """
+    x = first
+    while x <= last:
+        # skip whole bytes of already-archived ids in one comparison
+        while x <= last and (x & 7) == 0 and bits[x >> 3] == 0xFF:
+            x += 8
+        while x <= last and _seen(bits, x):
+            x += 1
+        if x > last:
+            return
+        start = x
+        # likewise skip whole bytes of missing ids while finding the run end
+        while x <= last:
+            if (x & 7) == 0 and bits[x >> 3] == 0x00:
+                x += 8
+            elif not _seen(bits, x):
+                x += 1
+            else:
+                break
+        yield (start, min(x, last + 1))
+
+
 def is_valid_file(path):
-    return os.path.isfile(path) and os.path.getsize(path) > 0
+    # one stat answers both questions; isfile() + getsize() stat twice
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISREG(st.st_mode) and st.st_size > 0
+
 
+# One logger serves the console and, when writeLogFile is set, the
+# "groupName.txt" file.  The FileHandler keeps the file descriptor open
+# between lines, and the lazy %-style call sites mean the message string
+# is only ever built when a handler will actually emit it.
+logger = logging.getLogger("archive_group")
 
-def log(msg, groupName):
-    print(msg)
+
+def setup_logging(groupName):
+    logger.setLevel(logging.INFO)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(console)
     if writeLogFile:
-        logF = open(groupName + ".txt", "a")
-        logF.write("\n" + msg)
-        logF.close()
+        logFile = logging.FileHandler(groupName + ".txt")
+        logFile.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(logFile)
 
 def make_request(groupName, url, max_retries=3, **kwargs):
-    if "cookies" not in kwargs:
-        kwargs["cookies"] = {"T": cookie_T, "Y": cookie_Y}
     if "allow_redirects" not in kwargs:
         kwargs["allow_redirects"] = True
+    if "timeout" not in kwargs:
+        kwargs["timeout"] = requestTimeout
 
-    s = requests.Session()
     attempt = 1
     while True:
-        resp = s.get(url, **kwargs)
+        governor.wait()
+        try:
+            resp = session.get(url, **kwargs)
+        except requests.exceptions.RequestException as requestError:
+            governor.on_error()
+            # a hung or dropped connection must not stall its worker forever;
+            # treat it like any other retryable failure
+            if attempt > max_retries:
+                logger.info(
+                    "Giving up on %s after attempt %s of %s (%s)",
+                    url,
+                    attempt,
+                    max_retries,
+                    requestError,
+                )
+                # a connection that stays dead through every retry is as
+                # unrecoverable as a Yahoo block: stop the other workers
+                # too instead of letting them keep hammering the site
+                _stopEvent.set()
+                raise
+            print(
+                "Retrying after attempt {} of {} for url {} ({})".format(
+                    attempt, max_retries, url, requestError
+                )
+            )
+            # Sleep for a capped exponential backoff; the random jitter keeps
+            # parallel workers from retrying in lockstep
+            time.sleep(min(60, 2 ** attempt) + random.random())
+            attempt += 1
+            continue
         if resp.status_code == 200:
+            governor.on_success()
             if attempt > 1:
                 print("Success on attempt {} of {}".format(attempt, max_retries))
             # Success!
             break
-        elif resp.status_code == 500:
+        governor.on_error()
+        if resp.status_code == 500:
             try:
-                pageJson = json.loads(resp.text)
+                pageJson = orjson.loads(resp.content)
                 if "ygError" not in pageJson:
-                    log("Internal Server Error while retrieving " + str(url) + ", exiting...", groupName)
-                    sys.exit()
+                    logger.info("Internal Server Error while retrieving %s, stopping...", url)
+                    _stopEvent.set()
+                    break
 
                 if pageJson["ygError"]["errorMessage"] == "Internal error: Error during message fetch":
-                    log("Skipped message " + str(url) + " due to Yahoo internal server error - you should retrieve message manually through the web interface.", groupName)
+                    logger.info("Skipped message %s due to Yahoo internal server error - you should retrieve message manually through the web interface.", url)
                     break
 
             except ValueError as valueError:
-                log(str(valueError) + " while parsing " + str(url) + "response, exiting...", groupName)
-                sys.exit()
+                logger.info("%s while parsing %s response, stopping...", valueError, url)
+                _stopEvent.set()
+                break
 
         elif attempt > max_retries or resp.status_code in (404,):
             # Unrecoverable error or max retries hit.  Time to leave no matter what.
-            log(
-                "Failed after attempt {} of {} for url {} (status: {})".format(
-                    attempt, max_retries, url, resp.status_code
-                ),
-                groupName,
+            logger.info(
+                "Failed after attempt %s of %s for url %s (status: %s)",
+                attempt,
+                max_retries,
+                url,
+                resp.status_code,
             )
             break
         print(
@@ -106,48 +491,35 @@ def make_request(groupName, url, max_retries=3, **kwargs):
                 attempt, max_retries, url, resp.status_code
             )
         )
-        time.sleep(attempt ** 2)  # Sleep for an incremental backoff
+        delay = None
+        if resp.status_code in (429, 503):
+            # Yahoo throttles gently before blocking outright; when it says
+            # exactly how long to stay away, hold the whole worker pool to
+            # that instead of guessing with backoff
+            delay = _retry_after_seconds(resp.headers.get("Retry-After"))
+            if delay is not None:
+                governor.hold_off(delay)
+        if delay is None:
+            # Sleep for a capped exponential backoff; the random jitter keeps
+            # parallel workers from retrying in lockstep
+            delay = min(60, 2 ** attempt) + random.random()
+        time.sleep(delay)
         attempt += 1
 
     return resp
 
 
 def archive_group(groupName, mode="update"):
-    log(
-        "\nArchiving group '"
-        + groupName
-        + "', mode: "
-        + mode
-        + " , on "
-        + time.strftime("%c"),
-        groupName,
+    if not logger.handlers:
+        setup_logging(groupName)
+    logger.info(
+        "\nArchiving group '%s', mode: %s , on %s", groupName, mode, time.strftime("%c")
     )
-    startTime = time.time()
+    if compressMessages and zstd is None:
+        sys.exit("compressMessages = True requires the zstandard package")
+    startTime = time.monotonic()
     msgsArchived = 0
-    if mode == "retry":
-        # don't archive any messages we already have
-        # but try to archive ones that we don't, and may have
-        # already attempted to archive
-        min = 1
-    elif mode == "update":
-        # start archiving at the last+1 message message we archived
-        mostRecent = 1
-        if os.path.exists(groupName):
-            oldDir = os.getcwd()
-            os.chdir(groupName)
-            for file in glob.glob("*.json"):
-                if int(file[0:-5]) > mostRecent:
-                    mostRecent = int(file[0:-5])
-            os.chdir(oldDir)
-
-        min = mostRecent
-    elif mode == "restart":
-        # delete all previous archival attempts and archive everything again
-        if os.path.exists(groupName):
-            shutil.rmtree(groupName)
-        min = 1
-
-    else:
+    if mode not in ("update", "retry", "restart"):
         print(
             "You have specified an invalid mode (" + mode + ").\n"
             "Valid modes are:\n"
@@ -156,24 +528,129 @@ def archive_group(groupName, mode="update"):
             "restart - delete archive and start from scratch"
         )
         sys.exit()
+    if mode == "restart":
+        # delete all previous archival attempts and archive everything again;
+        # a missing folder just means there is nothing to delete
+        try:
+            shutil.rmtree(groupName)
+        except FileNotFoundError:
+            pass
+
+    os.makedirs(groupName, exist_ok=True)
+    manifest = open_manifest(groupName)
+    if mode == "update":
+        # start archiving at the last+1 message message we archived; only
+        # the newest id matters here, so ask SQLite for MAX(id) instead of
+        # loading the entire archived set into Python
+        lastArchived = manifest.execute("SELECT MAX(id) FROM archived").fetchone()[0]
+        min = lastArchived if lastArchived is not None else 1
+        archivedIds = set() if lastArchived is None else {lastArchived}
+    else:
+        # retry (or a fresh restart): don't archive any messages we already
+        # have, but try to archive ones that we don't, and may have already
+        # attempted to archive
+        min = 1
+        archivedIds = {row[0] for row in manifest.execute("SELECT id FROM archived")}
 
-    if not os.path.exists(groupName):
-        os.makedirs(groupName)
     max = group_messages_max(groupName)
-    for x in range(min, max + 1):
-        if not is_valid_file(json_path(groupName, x)):
-            print("Archiving message " + str(x) + " of " + str(max))
-            success = archive_message(groupName, x)
-            if success == True:
-                msgsArchived = msgsArchived + 1
-
-    log(
-        "Archive finished, archived "
-        + str(msgsArchived)
-        + ", time taken is "
-        + str(time.time() - startTime)
-        + " seconds",
-        groupName,
+
+    # Pack the already-archived ids into a bitset: message ids are dense in
+    # [1, max], so one bit per id replaces both the per-id set entries and
+    # the stat() that is_valid_file would otherwise do for every message.
+    archived = bytearray((max >> 3) + 1)
+    for msgNumber in archivedIds:
+        if msgNumber <= max:
+            _mark(archived, msgNumber)
+
+    # the URL prefix never changes within a run, so build it once instead
+    # of interpreting a format string for every message
+    msgUrlPrefix = "https://groups.yahoo.com/api/v1/groups/{}/messages/".format(
+        groupName
+    )
+
+    # Iterate only the gaps between archived runs rather than testing every
+    # id from min to max - on a mostly complete archive this skips millions
+    # of per-id membership checks.  Counting the gaps up front also lets
+    # the progress output show remaining work instead of message-id ratios.
+    runs = list(missing_runs(archived, min, max))
+    totalMissing = sum(end - start for start, end in runs)
+    missing = itertools.chain.from_iterable(range(start, end) for start, end in runs)
+
+    def fetch(numbered):
+        i, x = numbered
+        if _stopEvent.is_set():
+            return x, False
+        print("Archiving message {} ({} of {} missing)".format(x, i, totalMissing))
+        try:
+            return x, archive_message(groupName, x, msgUrlPrefix)
+        except requests.exceptions.RequestException:
+            # make_request has already logged, retried and set _stopEvent;
+            # swallowing the exception here lets the run wind down in an
+            # orderly fashion instead of unwinding through executor.map
+            return x, False
+
+    # Downloads are independent and network-bound, so overlap the requests
+    # across a small pool of worker threads instead of waiting out one
+    # round trip to Yahoo per message.  Futures are submitted from the
+    # missing iterator with a bounded in-flight window (executor.map would
+    # eagerly create one Future per missing id - hundreds of MB on a large
+    # archive) and consumed in submission order.
+    newIds = []
+
+    def drain(future):
+        nonlocal msgsArchived
+        x, success = future.result()
+        if success == True:
+            msgsArchived = msgsArchived + 1
+            newIds.append(x)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threadCount) as executor:
+            pending = collections.deque()
+            for numbered in enumerate(missing, 1):
+                if _stopEvent.is_set():
+                    break
+                pending.append(executor.submit(fetch, numbered))
+                if len(pending) >= threadCount * 4:
+                    drain(pending.popleft())
+            while pending:
+                drain(pending.popleft())
+    finally:
+        # even if the run aborts, record what actually landed so the next
+        # run does not download the same messages again
+
+        # make sure every queued message has reached the disk first
+        _writeQueue.join()
+
+        # a message whose write failed was never archived: keep it out of
+        # the manifest (and the count) so a retry run fetches it again
+        if _failedWrites:
+            with _writerLock:
+                beforeFailed = len(newIds)
+                newIds = [i for i in newIds if i not in _failedWrites]
+            msgsArchived -= beforeFailed - len(newIds)
+            logger.info(
+                "%s message writes failed - rerun in retry mode to re-fetch them",
+                beforeFailed - len(newIds),
+            )
+
+        # then remember the new ids so the next run skips the directory walk
+        if newIds:
+            manifest.executemany(
+                "INSERT OR IGNORE INTO archived VALUES (?)", ((i,) for i in newIds)
+            )
+            manifest.commit()
+        manifest.close()
+
+    if _stopEvent.is_set():
+        logger.info(
+            "Stopped early due to an unrecoverable Yahoo error - "
+            "rerun in retry mode once unblocked"
+        )
+    logger.info(
+        "Archive finished, archived %s, time taken is %s seconds",
+        msgsArchived,
+        time.monotonic() - startTime,
     )
 
 
@@ -187,19 +664,21 @@ def group_messages_max(groupName):
     if resp.status_code != 200:
         sys.exit(1)
     try:
-        pageHTML = resp.text
-        pageJson = json.loads(pageHTML)
+        pageJson = orjson.loads(resp.content)
         return pageJson["ygData"]["totalRecords"]
     except ValueError as valueError:
-        print(
-            "Unexpected " + str(valueError) + " while getting message count.\n"
-            "If the group you are trying to archive is a private group, login\n"
-            "to a Yahoo account that has access to the private groups, then\n"
-            " extract the data from the cookies Y and T from the domain\n"
-            "yahoo.com . Paste this data into the appropriate variables\n"
-            "(cookie_Y and cookie_T) at the top of this script, and run the\n"
-            "script again.")
-        raise valuerError
+        if _LOGIN_RE.search(resp.content[:2048]):
+            print(
+                "Yahoo returned a login page instead of the message count.\n"
+                "If the group you are trying to archive is a private group, login\n"
+                "to a Yahoo account that has access to the private groups, then\n"
+                " extract the data from the cookies Y and T from the domain\n"
+                "yahoo.com . Paste this data into the appropriate variables\n"
+                "(cookie_Y and cookie_T) at the top of this script, and run the\n"
+                "script again.")
+        else:
+            print("Unexpected " + str(valueError) + " while getting message count.")
+        raise valueError
 
 def archive_attachments(groupName, msgNumber):
     # First, grab the URL that the web user interface uses to get the HTML page content.
@@ -210,19 +689,17 @@ def archive_attachments(groupName, msgNumber):
     resp = make_request(groupName, msgUrl)
     if resp.status_code != 200:
         return False
-    data = json.loads(resp.text)
+    data = orjson.loads(resp.content)
     html = data["html"]
 
     # Loop through any anchor tags that match the appropriate patterns.
-    href_pat = re.compile(r'href="(https://xa.yimg.com/kq/groups/.+?\?download=1)"')
-    filename_pat = re.compile(r'label="Download (?:photo|attachment) (.+?)"')
-    anchors = re.findall(re.compile(r"<a\s(.+?)>"), html)
+    anchors = _ANCHOR_RE.findall(html)
     for a in anchors:
-        m = href_pat.search(a)
+        m = _HREF_RE.search(a)
         if not m:
             continue
         url = m.group(1)
-        m = filename_pat.search(a)
+        m = _FILENAME_RE.search(a)
         if not m:
             continue
         filename = m.group(1)
@@ -233,27 +710,27 @@ def archive_attachments(groupName, msgNumber):
         if is_valid_file(savePath):
             print("Attachment {} already exists.".format(savePath))
         else:
-            r = make_request(groupName, url, headers={"referer": msgUrl})
-            if r.status_code == 200:
-                with open(savePath, "wb") as f:
-                    f.write(r.content)
-                    print("Saved attachment: {}".format(savePath))
-            elif r.status_code in (404,):
-                # Some times, attachments just aren't there.  We don't want that to
-                # trigger a False return value
-                pass
-            else:
-                return False
+            r = make_request(groupName, url, headers={"referer": msgUrl}, stream=True)
+            try:
+                if r.status_code == 200:
+                    save_attachment(groupName, savePath, r)
+                elif r.status_code in (404,):
+                    # Some times, attachments just aren't there.  We don't want that to
+                    # trigger a False return value
+                    pass
+                else:
+                    return False
+            finally:
+                r.close()
     return True
 
 
-def archive_message(groupName, msgNumber):
-    resp = make_request(
-        groupName,
-        "https://groups.yahoo.com/api/v1/groups/{}/messages/{}/raw".format(
-            groupName, msgNumber
-        ),
-    )
+def archive_message(groupName, msgNumber, urlPrefix=None):
+    if urlPrefix is None:
+        urlPrefix = "https://groups.yahoo.com/api/v1/groups/{}/messages/".format(
+            groupName
+        )
+    resp = make_request(groupName, urlPrefix + str(msgNumber) + "/raw")
     if resp.status_code != 200:
         return False
 
@@ -266,10 +743,14 @@ def archive_message(groupName, msgNumber):
         if not success:
             return False
 
-    msgJson = resp.text
-    writeFile = open(json_path(groupName, msgNumber), "wb")
-    writeFile.write(msgJson.encode("utf-8"))
-    writeFile.close()
+    # resp.content is the raw body bytes; going through resp.text would
+    # decode and re-encode the whole payload just to get the same bytes back
+    data = resp.content
+    jsonPath = json_path(groupName, msgNumber)
+    if compressMessages:
+        data = _compressor().compress(data)
+        jsonPath += ".zst"
+    queue_write(jsonPath, data, msgNumber)
     return True
 
 
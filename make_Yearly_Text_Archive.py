@@ -8,6 +8,7 @@ messages in a public Yahoo Group to be archived.
 The Text Archive Script allows you to take the downloaded json documents
 and turn them yearly archives of emails sorted into text documents.
 Note that the archive-group.py script must be run first.
+The shared logic lives in yearly_archive.py.
 
 This program is free software: you can redistribute it and/or modify
 it under the terms of the GNU General Public License as published by
@@ -22,121 +23,12 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import email
-import HTMLParser
-import json
-import os
 import sys
-from datetime import datetime
-from natsort import natsorted, ns
 
-# To avoid Unicode Issues
-reload(sys)
-sys.setdefaultencoding("utf-8")
+from yearly_archive import archiveGroup
 
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("You need to specify your group name")
 
-def archiveYahooMessage(file, archiveFile, messageYear, format):
-    try:
-        f = open(archiveFile, "a")
-        f.write(loadYahooMessage(file, format))
-        f.close()
-        print(
-            "Yahoo Message: {} archived to: archive-{}.txt".format(file, messageYear)
-        )
-    except Exception as e:
-        print("Yahoo Message: {} had an error:\n{}".format(file, e))
-
-
-def loadYahooMessage(file, format):
-    f1 = open(file, "r")
-    fileContents = f1.read()
-    f1.close()
-    jsonDoc = json.loads(fileContents)
-    emailMessageID = jsonDoc["ygData"]["msgId"]
-    emailMessageSender = (
-        HTMLParser.HTMLParser()
-        .unescape(jsonDoc["ygData"]["from"])
-        .decode(format)
-        .encode("utf-8")
-    )
-    emailMessageTimeStamp = jsonDoc["ygData"]["postDate"]
-    emailMessageDateTime = datetime.fromtimestamp(
-        float(emailMessageTimeStamp)
-    ).strftime("%Y-%m-%d %H:%M:%S")
-    emailMessageSubject = (
-        HTMLParser.HTMLParser()
-        .unescape(jsonDoc["ygData"]["subject"])
-        .decode(format)
-        .encode("utf-8")
-    )
-    emailMessageString = (
-        HTMLParser.HTMLParser()
-        .unescape(jsonDoc["ygData"]["rawEmail"])
-        .decode(format)
-        .encode("utf-8")
-    )
-    message = email.message_from_string(emailMessageString)
-    messageBody = getEmailBody(message)
-
-    messageText = "-----------------------------------------------------------------------------------\n"
-    messageText += "Post ID:" + str(emailMessageID) + "\n"
-    messageText += "Sender:" + emailMessageSender + "\n"
-    messageText += "Post Date/Time:" + emailMessageDateTime + "\n"
-    messageText += "Subject:" + emailMessageSubject + "\n"
-    messageText += "Message:" + "\n\n"
-    messageText += messageBody
-    messageText += "\n\n\n\n\n"
-    return messageText
-
-
-def getYahooMessageYear(file):
-    f1 = open(file, "r")
-    fileContents = f1.read()
-    f1.close()
-    jsonDoc = json.loads(fileContents)
-    emailMessageTimeStamp = jsonDoc["ygData"]["postDate"]
-    return datetime.fromtimestamp(float(emailMessageTimeStamp)).year
-
-
-# Thank you to the help in this forum for the bulk of this function
-# https://stackoverflow.com/questions/17874360/python-how-to-parse-the-body-from-a-raw-email-given-that-raw-email-does-not
-
-
-def getEmailBody(message):
-    body = ""
-    if message.is_multipart():
-        for part in message.walk():
-            ctype = part.get_content_type()
-            cdispo = str(part.get("Content-Disposition"))
-
-            # skip any text/plain (txt) attachments
-            if ctype == "text/plain" and "attachment" not in cdispo:
-                body += part.get_payload(decode=True)  # decode
-                break
-    # not multipart - i.e. plain text, no attachments, keeping fingers crossed
-    else:
-        body += message.get_payload(decode=True)
-    return body
-
-
-## This is where the script starts
-
-if len(sys.argv) < 2:
-    sys.exit("You need to specify your group name")
-
-groupName = sys.argv[1]
-oldDir = os.getcwd()
-if os.path.exists(groupName):
-    archiveDir = os.path.abspath(groupName + "-archive")
-    if not os.path.exists(archiveDir):
-        os.makedirs(archiveDir)
-    os.chdir(groupName)
-    for file in natsorted(os.listdir(os.getcwd())):
-        messageYear = getYahooMessageYear(file)
-        archiveFile = archiveDir + "/archive-" + str(messageYear) + ".txt"
-        archiveYahooMessage(file, archiveFile, messageYear, "utf-8")
-else:
-    sys.exit("Please run archive-group.py first")
-
-os.chdir(oldDir)
-print ("Complete")
+    archiveGroup(sys.argv[1])
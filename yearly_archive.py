@@ -0,0 +1,257 @@
+"""
+Yahoo-Groups-Archiver, Yearly Archive Module Copyright 2019 Robert Lancaster and others
+
+YahooGroups-Archiver, a simple python script that allows for all
+messages in a public Yahoo Group to be archived.
+
+This module holds the message loading and formatting logic shared by
+make_Yearly_Text_Archive.py and make_Yearly_Text_Archive_html.py, which
+are thin wrappers around archiveGroup(). Note that the archive_group.py
+script must be run first.
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections  # required for the bounded queue of parsed-ahead messages
+import concurrent.futures  # required to read and format messages in parallel
+import email
+import email.utils
+import html
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+try:
+    import orjson  # parses JSON several times faster than the stdlib
+except ImportError:
+    orjson = json  # fall back to the stdlib parser, same interface here
+
+# How many messages to read and format in parallel ahead of the writer
+loaderThreads = 8
+
+# Fast path for pulling postDate out of a message file: the field sits in
+# the small ygData header near the start of the JSON, so a bounded scan
+# over the first 4 KiB avoids parsing the whole (often huge) rawEmail.
+_POSTDATE_RE = re.compile(rb'"postDate"\s*:\s*"?(\d+)')
+
+# Matches the Date: header inside a raw email; used as a fallback when a
+# message has no usable postDate.  One compiled pattern, one finditer
+# sweep over the text.
+_DATE_HEADER_RE = re.compile(r"^Date:[ \t]*(.+)$", re.MULTILINE | re.IGNORECASE)
+
+# Bind the per-message date helpers once; skipping the attribute walk on
+# every call adds up over hundreds of thousands of messages.
+_fromtimestamp = datetime.fromtimestamp
+_parsedate = email.utils.parsedate_to_datetime
+
+
+def _yearFromDateHeader(rawEmail):
+    """ Pull the year out of the email's own Date: header, or None """
+    # email headers sit at the top of the message, so scanning (and HTML-
+    # unescaping) a 4 KiB head slice almost always finds the Date: line
+    # without touching the whole body; sweep the full text only if not
+    for text in (rawEmail[:4096], rawEmail):
+        for m in _DATE_HEADER_RE.finditer(html.unescape(text)):
+            try:
+                return _parsedate(m.group(1).strip()).year
+            except (TypeError, ValueError):
+                continue
+        if len(rawEmail) <= 4096:
+            break
+    return None
+
+
+def _loadMessage(task):
+    """ Worker side of the pipeline: read, date and format one message """
+    file, asHtml = task
+    try:
+        with open(file, "rb") as fh:
+            fileContents = fh.read()
+        messageYear = getYahooMessageYear(file, fileContents)
+        return file, messageYear, loadYahooMessage(file, "utf-8", asHtml, fileContents)
+    except Exception as e:
+        print("Yahoo Message: {} had an error:\n{}".format(file, e))
+        return file, None, None
+
+
+def loadYahooMessage(file, format, asHtml=False, fileContents=None):
+    if fileContents is None:
+        with open(file, "rb") as f1:
+            fileContents = f1.read()
+    jsonDoc = orjson.loads(fileContents)
+    emailMessageID = jsonDoc["ygData"]["msgId"]
+    emailMessageSender = html.unescape(jsonDoc["ygData"]["from"])
+    emailMessageTimeStamp = jsonDoc["ygData"]["postDate"]
+    # isoformat produces the same "YYYY-MM-DD HH:MM:SS" string as a
+    # strftime call without interpreting a format string per message
+    emailMessageDateTime = _fromtimestamp(
+        int(float(emailMessageTimeStamp))
+    ).isoformat(" ")
+    emailMessageSubject = html.unescape(jsonDoc["ygData"]["subject"])
+    emailMessageString = html.unescape(jsonDoc["ygData"]["rawEmail"])
+    message = email.message_from_string(emailMessageString)
+    messageBody = getEmailBody(message, format, asHtml)
+
+    # build the message as a list joined once at the end; repeated "+="
+    # re-copies the whole (message-sized) string on every append
+    separator = "-" * 83
+    if asHtml:
+        parts = [
+            separator, "<br>\n",
+            "Post ID:", str(emailMessageID), "<br>\n",
+            "Sender:", html.escape(emailMessageSender), "<br>\n",
+            "Post Date/Time:", emailMessageDateTime, "<br>\n",
+            "Subject:", html.escape(emailMessageSubject), "<br>\n",
+            "Message:<br><br>\n",
+            messageBody,
+            "<br><br><br><br><br>\n",
+        ]
+    else:
+        parts = [
+            separator, "\n",
+            "Post ID:", str(emailMessageID), "\n",
+            "Sender:", emailMessageSender, "\n",
+            "Post Date/Time:", emailMessageDateTime, "\n",
+            "Subject:", emailMessageSubject, "\n",
+            "Message:\n\n",
+            messageBody,
+            "\n\n\n\n\n",
+        ]
+    return "".join(parts)
+
+
+def getYahooMessageYear(file, fileContents=None):
+    if fileContents is None:
+        with open(file, "rb") as f1:
+            head = f1.read(4096)
+            m = _POSTDATE_RE.search(head)
+            if m and m.group(1) != b"0":
+                return _fromtimestamp(float(m.group(1))).year
+            # rare: no usable postDate up front, fall back to a full parse
+            fileContents = head + f1.read()
+    else:
+        m = _POSTDATE_RE.search(fileContents[:4096])
+        if m and m.group(1) != b"0":
+            return _fromtimestamp(float(m.group(1))).year
+    jsonDoc = orjson.loads(fileContents)
+    emailMessageTimeStamp = jsonDoc["ygData"].get("postDate")
+    if emailMessageTimeStamp and float(emailMessageTimeStamp):
+        return _fromtimestamp(float(emailMessageTimeStamp)).year
+    # some messages carry no postDate (or a zero one); rather than filing
+    # them under 1970, trust the raw email's own Date: header
+    year = _yearFromDateHeader(jsonDoc["ygData"].get("rawEmail", ""))
+    if year is None:
+        raise ValueError("no usable date in {}".format(file))
+    return year
+
+
+# Thank you to the help in this forum for the bulk of this function
+# https://stackoverflow.com/questions/17874360/python-how-to-parse-the-body-from-a-raw-email-given-that-raw-email-does-not
+
+
+def getEmailBody(message, format="utf-8", asHtml=False):
+    body = ""
+    if message.is_multipart():
+        for part in message.walk():
+            ctype = part.get_content_type()
+            cdispo = str(part.get("Content-Disposition"))
+
+            # skip any text/plain (txt) attachments
+            if ctype == "text/plain" and "attachment" not in cdispo:
+                text = part.get_payload(decode=True).decode(format, "replace")
+                if asHtml:
+                    body += "<pre>" + html.escape(text) + "</pre>"
+                else:
+                    body += text
+                break
+    # not multipart - i.e. plain text, no attachments, keeping fingers crossed
+    else:
+        text = message.get_payload(decode=True).decode(format, "replace")
+        if asHtml and message.get_content_type() != "text/html":
+            body += "<pre>" + html.escape(text) + "</pre>"
+        else:
+            body += text
+    return body
+
+
+def archiveGroup(groupName, asHtml=False):
+    if not os.path.exists(groupName):
+        sys.exit("Please run archive_group.py first")
+
+    archiveDir = os.path.abspath(groupName + "-archive")
+    os.makedirs(archiveDir, exist_ok=True)
+    extension = "html" if asHtml else "txt"
+    # One os.scandir pass replaces the chdir + natsorted(os.listdir())
+    # dance: message filenames are plain integers, so sorting the ids
+    # numerically gives the order natsort produced without the per-name
+    # natural-sort parsing or the process-global chdir.
+    with os.scandir(groupName) as entries:
+        msgIds = sorted(
+            int(entry.name[:-5])
+            for entry in entries
+            if entry.name.endswith(".json")
+            and entry.name[:-5].isdigit()
+            and entry.is_file(follow_symlinks=False)
+        )
+    # Ids are roughly chronological, so years arrive in long runs; keep one
+    # archive file handle open per run instead of reopening (and closing,
+    # which also flushes) the same file for every single message.
+    currentYear = None
+    archiveFh = None
+
+    def writeMessage(file, messageYear, messageText):
+        nonlocal currentYear, archiveFh
+        if messageText is None:
+            return  # the worker already reported the error
+        if messageYear != currentYear:
+            if archiveFh is not None:
+                archiveFh.close()
+            archiveFile = "{}/archive-{}.{}".format(archiveDir, messageYear, extension)
+            # a 1 MiB buffer keeps individual write syscalls well above
+            # the size where per-call overhead dominates
+            archiveFh = open(archiveFile, "a", buffering=1 << 20)
+            if asHtml and archiveFh.tell() == 0:
+                archiveFh.write("<style>pre {white-space: pre-wrap;}</style>\n")
+            currentYear = messageYear
+        archiveFh.write(messageText)
+        print(
+            "Yahoo Message: {} archived to: archive-{}.{}".format(
+                file, messageYear, extension
+            )
+        )
+
+    # Pipeline: a small thread pool reads and formats messages ahead while
+    # this thread writes serially, so a slow parse never stalls the next
+    # read.  Results are consumed in submission order and the in-flight
+    # window is bounded so the whole archive is never buffered in memory.
+    tasks = (
+        (os.path.join(groupName, "{}.json".format(msgId)), asHtml)
+        for msgId in msgIds
+    )
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=loaderThreads
+        ) as executor:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(executor.submit(_loadMessage, task))
+                if len(pending) >= loaderThreads * 4:
+                    writeMessage(*pending.popleft().result())
+            while pending:
+                writeMessage(*pending.popleft().result())
+    finally:
+        if archiveFh is not None:
+            archiveFh.close()
+    print("Complete")